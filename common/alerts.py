@@ -84,6 +84,15 @@ class Alert:
         }
         return data
 
+    @classmethod
+    def from_export(cls, symbol, data, quiet_mode=False, sms_client=None, logger=None):
+        """ Rebuild an alert from the output of export() - used to resume checkpointed monitors """
+        alert = cls(symbol, txt=data['txt'], url=data['url'], quiet_mode=quiet_mode, sms_client=sms_client,
+                    logger=logger)
+        alert.history = list(data['history'])
+        alert.curr_tier = alert.history[-1]['tier']
+        return alert
+
     def _base(self, msg, tier, trigger):
         """ Base alert code. Returns alert msg for logs. """
         self.curr_tier = tier
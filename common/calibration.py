@@ -0,0 +1,194 @@
+import os
+import glob
+import pickle
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from common.config import RED_ALERT_GAIN_THRESH, AMBER_ALERT_GAIN_THRESH, MONITOR_INTERVALS, MONITOR_INTERVALS_REDUCED
+
+DATA_LOG_PATH = os.path.join('logs', 'data')
+INTERVALS = MONITOR_INTERVALS
+THRESHOLDS = np.round(np.arange(0.1, 10.05, 0.1), 2)  # candidate % gain thresholds
+TARGET_GAIN = 5.0  # % peak gain within the horizon that counts as a real pump
+RED_BETA = 0.5  # F-beta weighting for red thresholds - favours precision (red alerts send sms)
+AMBER_BETA = 2.0  # F-beta weighting for amber thresholds - favours recall
+
+
+def load_event(path, intervals=INTERVALS):
+    """
+    Load a logged monitor event and reduce it to the arrays needed for calibration.
+    Gains are aligned to the given intervals so reduced mode events can be stacked with normal ones.
+    :param path: path to a pickle written by TwitterMonitor.monitor_market
+    :param intervals: intervals to align gains to
+    :return: dict of event data
+    """
+    with open(path, 'rb') as f:
+        data = pickle.load(f)
+
+    logged_intervals = data.get('intervals')
+    if logged_intervals is None:
+        # older logs don't record intervals - infer from reduced mode length
+        logged_intervals = MONITOR_INTERVALS if len(data['gains']) == len(MONITOR_INTERVALS) \
+            else MONITOR_INTERVALS_REDUCED
+    gains = np.full(len(intervals), np.nan)
+    for interval, gain in zip(logged_intervals, data['gains']):
+        if interval in intervals:
+            gains[intervals.index(interval)] = gain
+
+    if data['trades'] is not None:
+        trade_prices = np.array([t['price'] for t in data['trades']['after']], dtype=float)
+    else:
+        trade_prices = np.empty(0)
+
+    return {
+        'symbol': data['symbol'],
+        'timestamp': data['timestamp'],
+        'log all': data.get('log all', False),
+        'init price': data['init price'],
+        'gains': gains,
+        'ohlcv': np.asarray(data['ohlcv'], dtype=float).reshape(-1, 6),
+        'trade prices': trade_prices
+    }
+
+
+def load_events(paths, workers=None, intervals=INTERVALS):
+    """
+    Load logged events in parallel and stack them into arrays. Ragged arrays are padded with nan.
+    :param paths: list of event pickle paths
+    :param workers: number of worker processes - defaults to cpu count
+    :param intervals: intervals to align gains to
+    :return: dict of stacked arrays (first axis is event)
+    """
+    paths = list(paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(paths) // (4 * (workers or os.cpu_count() or 1)))
+        events = list(executor.map(load_event, paths, [intervals] * len(paths), chunksize=chunksize))
+
+    n = len(events)
+    max_candles = max([len(e['ohlcv']) for e in events], default=0)
+    max_trades = max([len(e['trade prices']) for e in events], default=0)
+    ohlcv = np.full((n, max_candles, 6), np.nan)
+    trade_prices = np.full((n, max_trades), np.nan)
+    for i, e in enumerate(events):
+        ohlcv[i, :len(e['ohlcv'])] = e['ohlcv']
+        trade_prices[i, :len(e['trade prices'])] = e['trade prices']
+
+    return {
+        'symbols': np.array([e['symbol'] for e in events]),
+        'timestamps': np.array([e['timestamp'] for e in events], dtype='datetime64[ms]'),
+        'log all': np.array([e['log all'] for e in events], dtype=bool),
+        'init prices': np.array([e['init price'] for e in events], dtype=float),
+        'gains': np.array([e['gains'] for e in events], dtype=float).reshape(n, len(intervals)),
+        'ohlcv': ohlcv,
+        'trade prices': trade_prices
+    }
+
+
+def peak_gains(events, horizon=INTERVALS[-1]):
+    """
+    Largest % gain over the init price within the horizon after each event, from OHLCV highs and logged trades.
+    :param events: output of load_events()
+    :param horizon: seconds after the event to look for a peak
+    :return: array of peak gains (nan where there is no data)
+    """
+    init_ms = events['timestamps'].astype('int64')[:, None]
+    candle_ts = events['ohlcv'][:, :, 0]
+    highs = events['ohlcv'][:, :, 2]
+    # include the candle the event falls in
+    in_window = (candle_ts > init_ms - 60 * 1000) & (candle_ts <= init_ms + horizon * 1000)
+    peak = np.where(in_window & ~np.isnan(highs), highs, -np.inf).max(axis=1, initial=-np.inf)
+    trades = events['trade prices']
+    peak = np.maximum(peak, np.where(np.isnan(trades), -np.inf, trades).max(axis=1, initial=-np.inf))
+    peak[np.isinf(peak)] = np.nan
+    return 100 * (peak / events['init prices'] - 1)
+
+
+def sweep(gains, labels, thresholds=THRESHOLDS):
+    """
+    Evaluate every candidate threshold at every interval at once.
+    :param gains: (events, intervals) array of % gains - nan gains never alert
+    :param labels: (events,) bool array of real pumps
+    :param thresholds: (thresholds,) array of candidate % gain thresholds
+    :return: dict of (thresholds, intervals) arrays: alerts, true positives, precision and recall
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        alerts = gains[None, :, :] > thresholds[:, None, None]
+        alert_counts = alerts.sum(axis=1)
+        true_pos = (alerts & labels[None, :, None]).sum(axis=1)
+        precision = np.where(alert_counts > 0, true_pos / alert_counts, np.nan)
+        recall = true_pos / labels.sum() if labels.any() else np.full(true_pos.shape, np.nan)
+    return {'alerts': alert_counts, 'true positives': true_pos, 'precision': precision, 'recall': recall}
+
+
+def recommend(results, thresholds=THRESHOLDS, intervals=INTERVALS, beta=1.0, min_alerts=1, low=None, high=None,
+              default=None):
+    """
+    Pick the threshold with the best F-beta score for each interval.
+    :param results: output of sweep()
+    :param beta: recall is weighted beta times as much as precision
+    :param min_alerts: ignore thresholds that produce fewer alerts than this
+    :param low: optional interval : lowest allowed threshold
+    :param high: optional interval : thresholds must be below this
+    :param default: optional interval : threshold used when no candidate qualifies (if it is within bounds)
+    :return: threshold table - interval (seconds) : % gain. If nothing qualifies and there is no usable default,
+    the largest allowed candidate (or the lower bound if there are none) is used.
+    """
+    p, r = results['precision'], results['recall']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        f = (1 + beta ** 2) * p * r / (beta ** 2 * p + r)
+    f = np.where(np.isnan(f) | (results['alerts'] < min_alerts), -1, f)
+    table = {}
+    for k, interval in enumerate(intervals):
+        lo = -np.inf if low is None else low[interval]
+        hi = np.inf if high is None else high[interval]
+        allowed = (thresholds >= lo) & (thresholds < hi)
+        scores = np.where(allowed, f[:, k], -1)
+        best = np.argmax(scores)
+        if scores[best] >= 0:
+            table[interval] = float(thresholds[best])
+        elif default is not None and lo <= default[interval] < hi:
+            table[interval] = float(default[interval])
+        elif allowed.any():
+            table[interval] = float(thresholds[allowed][-1])
+        else:
+            table[interval] = float(lo)
+    return table
+
+
+def calibrate(path=DATA_LOG_PATH, workers=None, target_gain=TARGET_GAIN, thresholds=THRESHOLDS, min_alerts=1):
+    """
+    Full calibration run over all logged events.
+    Events are only logged when an alert fired unless the monitor ran with log_all, so events below the current
+    amber thresholds are missing and precision is inflated for lower candidates. Unless every event was logged
+    with log_all, thresholds are not recommended below the current AMBER_ALERT_GAIN_THRESH.
+    Red thresholds are always above amber so both tiers stay reachable.
+    :param path: directory of logged events
+    :param workers: number of worker processes
+    :param target_gain: peak % gain that counts as a real pump
+    :param thresholds: candidate % gain thresholds (sorted ascending)
+    :param min_alerts: minimum alerts for a threshold to be recommended
+    :return: dict with sweep results and recommended red and amber tables
+    """
+    paths = sorted(glob.glob(os.path.join(path, '*.p')))
+    if not paths:
+        raise FileNotFoundError('No logged events in {}'.format(path))
+    events = load_events(paths, workers=workers)
+    labels = peak_gains(events) >= target_gain
+    results = sweep(events['gains'], labels, thresholds)
+
+    unbiased = bool(events['log all'].all())
+    amber_low = {i: (thresholds[0] if unbiased else AMBER_ALERT_GAIN_THRESH[i]) for i in INTERVALS}
+    # red must leave room for at least one amber candidate below it
+    red_low = {i: thresholds[min(np.searchsorted(thresholds, amber_low[i], side='right'), len(thresholds) - 1)]
+               for i in INTERVALS}
+    red = recommend(results, thresholds, beta=RED_BETA, min_alerts=min_alerts, low=red_low,
+                    default=RED_ALERT_GAIN_THRESH)
+    amber = recommend(results, thresholds, beta=AMBER_BETA, min_alerts=min_alerts, low=amber_low, high=red,
+                      default=AMBER_ALERT_GAIN_THRESH)
+    return {
+        'events': len(paths),
+        'positives': int(labels.sum()),
+        'unbiased': unbiased,
+        'results': results,
+        'red': red,
+        'amber': amber
+    }
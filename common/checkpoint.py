@@ -0,0 +1,86 @@
+import os
+import pickle
+import threading
+
+STATE_PATH = os.path.join('logs', 'state', 'monitor.p')
+REPLAY_STATE_PATH = os.path.join('logs', 'state', 'replay.p')  # kept apart so replays never touch live state
+
+
+class Checkpoint:
+    """
+    Small local state file holding active monitoring sessions and the id of the last tweet seen.
+    Sessions are updated by monitor threads as they go and the whole state is written to disk periodically
+    by the main loop, so a crashed monitor can resume its sessions and backfill missed tweets on restart.
+    """
+    def __init__(self, path=STATE_PATH, logger=None):
+        self.path = path
+        self.logger = logger
+        self.sessions = {}  # key : session dict (symbol, init price, init time, gains, alert history)
+        self.cursor = None  # id of the newest tweet processed
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def load(self):
+        """
+        Load state from disk if a checkpoint exists. Returns True if state was loaded.
+        A corrupt state file is moved aside and the monitor starts clean.
+        """
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+            sessions, cursor = state['sessions'], state['cursor']
+        except (EOFError, pickle.UnpicklingError, ValueError, KeyError, TypeError, AttributeError) as e:
+            msg = 'Corrupt checkpoint {} ({}: {}) - starting clean'.format(self.path, type(e).__name__, e)
+            if self.logger is None:
+                print(msg)
+            else:
+                self.logger.error(msg)
+            os.replace(self.path, self.path + '.corrupt')
+            return False
+        with self._lock:
+            self.sessions = sessions
+            self.cursor = cursor
+            self._dirty = False
+        return True
+
+    def save(self, force=False):
+        """ Write state to disk if it has changed since the last save. Writes are atomic. """
+        with self._lock:
+            if not self._dirty and not force:
+                return
+            state = {'sessions': dict(self.sessions), 'cursor': self.cursor}
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())  # the new state must be on disk before it replaces the old one
+        os.replace(tmp_path, self.path)
+
+    def set_session(self, key, session):
+        with self._lock:
+            self.sessions[key] = session
+            self._dirty = True
+
+    def remove_session(self, key):
+        with self._lock:
+            if self.sessions.pop(key, None) is not None:
+                self._dirty = True
+
+    def has_session(self, key):
+        with self._lock:
+            return key in self.sessions
+
+    def active_sessions(self):
+        with self._lock:
+            return list(self.sessions.values())
+
+    def set_cursor(self, tweet_id):
+        """ Advance the tweet cursor - it never moves backwards """
+        with self._lock:
+            if self.cursor is None or tweet_id > self.cursor:
+                self.cursor = tweet_id
+                self._dirty = True
@@ -0,0 +1,127 @@
+import threading
+import time
+from contextlib import contextmanager
+from queue import Queue, Empty
+
+
+class ClientPool:
+    """
+    Fixed pool of preconfigured exchange clients. ccxt instances are not safe to share between threads
+    (the rate limiter and session state are not coordinated), so each monitor thread checks a client out
+    for the duration of a batch of requests and hands it back afterwards.
+    Every client keeps its own HTTP session alive between requests and market metadata is loaded once and
+    shared between all clients in the pool. Exchanges rate limit by IP, so all clients share one RateLimiter.
+    """
+    def __init__(self, exchange_class, size=4, config=None, timeout=None):
+        """
+        :param exchange_class: ccxt exchange class (e.g. ccxt.binance) or any callable taking a config dict
+        :param size: number of client instances in the pool
+        :param config: optional ccxt config dict applied to every client
+        :param timeout: seconds to wait for a free client before raising PoolExhaustedError (None = wait forever)
+        """
+        assert size > 0, 'Pool size must be positive'
+        self.size = size
+        self.timeout = timeout
+        config = {'enableRateLimit': True} if config is None else dict(config)
+        self.clients = [exchange_class(dict(config)) for _ in range(size)]
+        self.rate_limiter = RateLimiter(self.clients[0].rateLimit)
+        for client in self.clients:
+            client.throttle = self.rate_limiter.throttle  # replaces the per-instance ccxt throttle
+        self._idle = Queue()
+        for client in self.clients:
+            self._idle.put(client)
+
+        self._lock = threading.Lock()
+        self._markets_lock = threading.Lock()  # held while loading markets so stats and checkouts aren't blocked
+        self._markets_loaded = False
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._checkouts = 0
+        self._waits = 0  # checkouts that had to wait for a free client
+        self._wait_time = 0.  # seconds
+
+    @contextmanager
+    def client(self):
+        """ Context manager that checks out a client and always returns it to the pool """
+        client = self.acquire()
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def acquire(self):
+        """ Check out a client, blocking until one is free. Call release() when done with it. """
+        self.load_markets()
+        t0 = time.time()
+        try:
+            client = self._idle.get_nowait()
+            waited = False
+        except Empty:
+            try:
+                client = self._idle.get(timeout=self.timeout)
+            except Empty:
+                raise PoolExhaustedError('No free client after {}s (pool size {})'.format(self.timeout, self.size))
+            waited = True
+        with self._lock:
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+                self._wait_time += time.time() - t0
+        return client
+
+    def release(self, client):
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(client)
+
+    def load_markets(self, reload=False):
+        """ Load market metadata with one client and share it with the rest of the pool """
+        if self._markets_loaded and not reload:
+            return
+        with self._markets_lock:
+            if self._markets_loaded and not reload:
+                return
+            markets = self.clients[0].load_markets(reload)
+            for client in self.clients[1:]:
+                client.set_markets(markets, self.clients[0].currencies)
+            self._markets_loaded = True
+
+    def stats(self):
+        """ Pool utilisation stats for sizing the pool against burst load """
+        with self._lock:
+            return {
+                'size': self.size,
+                'in use': self._in_use,
+                'peak in use': self._peak_in_use,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'mean wait': self._wait_time / self._waits if self._waits else 0.,
+                'utilisation': self._in_use / self.size
+            }
+
+
+class RateLimiter:
+    """ Thread-safe request throttle shared by every client in a pool """
+    def __init__(self, rate_limit):
+        """
+        :param rate_limit: milliseconds between requests (ccxt rateLimit)
+        """
+        self.rate_limit = rate_limit
+        self._lock = threading.Lock()
+        self._next_request = 0.  # time the next request slot opens
+
+    def throttle(self, cost=None):
+        """ Reserve the next request slot and sleep until it opens. Same signature as ccxt Exchange.throttle """
+        cost = 1 if cost is None else cost
+        with self._lock:
+            now = time.time()
+            delay = max(0., self._next_request - now)
+            self._next_request = max(now, self._next_request) + self.rate_limit * cost / 1000
+        if delay > 0:
+            time.sleep(delay)
+
+
+class PoolExhaustedError(Exception):
+    pass
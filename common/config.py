@@ -0,0 +1,5 @@
+# Monitoring intervals and alert thresholds shared by the monitor and offline tools
+RED_ALERT_GAIN_THRESH = {30: 0.6, 60: 1.1, 150: 1.8, 300: 3.0, 600: 5.0}  # interval (seconds) : % gain
+AMBER_ALERT_GAIN_THRESH = {30: 0.4, 60: 0.9, 150: 1.4, 300: 2.5, 600: 4.5}  # interval (seconds) : % gain
+MONITOR_INTERVALS = [30, 60, 150, 300, 600]  # seconds
+MONITOR_INTERVALS_REDUCED = [60, 300, 600]  # seconds - for longer twitter check intervals
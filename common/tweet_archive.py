@@ -0,0 +1,271 @@
+import os
+import json
+import sqlite3
+import struct
+import threading
+import zlib
+from datetime import timezone
+from common.util import twitter_epoch
+from common.alerts import check_custom_triggers, BINANCE_TRIGGERS
+
+ARCHIVE_PATH = os.path.join('logs', 'tweets')
+HEADER = struct.Struct('<I')  # compressed record length
+
+
+class TweetArchive:
+    """
+    Append-only archive of every tweet ingested by the monitor.
+    Tweets are stored as individually compressed records in a single log file. A sqlite index maps tweet id,
+    handle, symbol and timestamp to record offsets so lookups and range queries only read the records they need.
+    Wrapped in a TweetReplay it can stand in for the twitter client when replaying history.
+    """
+    def __init__(self, path=ARCHIVE_PATH, handle_list=None, read_only=False, logger=None):
+        """
+        :param path: directory for the log and index files
+        :param handle_list: symbol : twitter handle dict used to tag tweets with their symbol. Tweets from a handle
+        shared by several symbols are stored without a symbol, as the monitor can't tell which coin they are for.
+        :param read_only: open for queries only - use this alongside a running monitor. Recovery is skipped and
+        only records covered by the last index commit are visible.
+        :param logger: optional logger
+        """
+        self.log_path = os.path.join(path, 'archive.log')
+        self.index_path = os.path.join(path, 'archive.idx')
+        self.logger = logger
+        self.symbols = self._symbols({} if handle_list is None else handle_list)  # handle : symbol (None if shared)
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        if read_only:
+            self._db = sqlite3.connect('file:{}?mode=ro'.format(self.index_path), uri=True, check_same_thread=False)
+            self._log = None
+            return
+        os.makedirs(path, exist_ok=True)
+        self._db = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS tweets (
+                id INTEGER PRIMARY KEY, handle TEXT, symbol TEXT, ts REAL, offset INTEGER, length INTEGER);
+            CREATE INDEX IF NOT EXISTS ts_idx ON tweets (ts);
+            CREATE INDEX IF NOT EXISTS handle_idx ON tweets (handle, ts);
+            CREATE INDEX IF NOT EXISTS symbol_idx ON tweets (symbol, ts);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+        """)
+        self._log = open(self.log_path, 'ab')
+        self._recover()
+
+    def append(self, tweet):
+        """ Archive a single tweet. Returns False if it was already archived. """
+        return self.extend([tweet]) == 1
+
+    def extend(self, tweets):
+        """ Archive a batch of tweets, skipping any already archived. Returns the number added. """
+        if self.read_only:
+            raise PermissionError('Archive {} is open read only'.format(self.log_path))
+        with self._lock:
+            added = 0
+            start = self._log.tell()
+            try:
+                for tweet in tweets:
+                    if self._db.execute('SELECT 1 FROM tweets WHERE id = ?', (tweet['id'],)).fetchone() is None:
+                        self._write(tweet)
+                        added += 1
+                if added:
+                    # the log must be on disk before the index points at it
+                    self._log.flush()
+                    os.fsync(self._log.fileno())
+                    self._set_indexed_size(self._log.tell())
+                    self._db.commit()
+            except Exception:
+                self._db.rollback()
+                self._log.truncate(start)
+                self._log.seek(0, os.SEEK_END)
+                raise
+        return added
+
+    def get(self, tweet_id):
+        """ Look up a tweet by id. Returns None if it is not archived. """
+        with self._lock:
+            row = self._db.execute('SELECT offset, length FROM tweets WHERE id = ?', (tweet_id,)).fetchone()
+        if row is None:
+            return None
+        with open(self.log_path, 'rb') as f:
+            return self._read(f, *row)
+
+    def query(self, handle=None, symbol=None, start=None, end=None, reverse=False):
+        """
+        Stream archived tweets matching all given filters in time order.
+        :param handle: twitter handle
+        :param symbol: coin symbol
+        :param start: datetime (UTC) - tweets at or after this time
+        :param end: datetime (UTC) - tweets before this time
+        :param reverse: yield newest tweets first
+        """
+        conditions, params = [], []
+        if handle is not None:
+            conditions.append('handle = ?')
+            params.append(handle.lower())
+        if symbol is not None:
+            conditions.append('symbol = ?')
+            params.append(symbol)
+        if start is not None:
+            conditions.append('ts >= ?')
+            params.append(start.replace(tzinfo=timezone.utc).timestamp())
+        if end is not None:
+            conditions.append('ts < ?')
+            params.append(end.replace(tzinfo=timezone.utc).timestamp())
+        sql = 'SELECT offset, length FROM tweets'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY ts {0}, id {0}'.format('DESC' if reverse else 'ASC')
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        with open(self.log_path, 'rb') as f:
+            for offset, length in rows:
+                yield self._read(f, offset, length)
+
+    def get_list_statuses(self, since_id=None, max_id=None, count=20, until=None, **kwargs):
+        """
+        Mirrors the twython call used by the monitor. Returns up to count tweets newest first.
+        :param until: optional datetime (UTC) - only return tweets posted at or before this time
+        Other kwargs (slug, owner_screen_name) are ignored.
+        """
+        conditions, params = [], []
+        if until is not None:
+            conditions.append('ts <= ?')
+            params.append(until.replace(tzinfo=timezone.utc).timestamp())
+        if since_id is not None:
+            conditions.append('id > ?')
+            params.append(since_id)
+        if max_id is not None:
+            conditions.append('id <= ?')
+            params.append(max_id)
+        sql = 'SELECT offset, length FROM tweets'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY id DESC LIMIT ?'
+        with self._lock:
+            rows = self._db.execute(sql, params + [count]).fetchall()
+        with open(self.log_path, 'rb') as f:
+            return [self._read(f, offset, length) for offset, length in rows]
+
+    def check_triggers(self, custom_triggers=BINANCE_TRIGGERS, **filters):
+        """
+        Run a trigger list against archived tweets. Takes the same filters as query().
+        :return: list of (tweet, matched triggers) for every tweet that matched at least one trigger
+        """
+        matches = []
+        for tweet in self.query(**filters):
+            triggers = check_custom_triggers(tweet['user']['screen_name'].lower(), tweet['text'], custom_triggers)
+            if triggers:
+                matches.append((tweet, triggers))
+        return matches
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+            self._db.close()
+
+    def __iter__(self):
+        """ Stream every indexed tweet in the order it was ingested """
+        with self._lock:
+            end = self._indexed_size()
+        with open(self.log_path, 'rb') as f:
+            while f.tell() < end:  # anything past the committed size may still be being written
+                header = f.read(HEADER.size)
+                length, = HEADER.unpack(header)
+                yield json.loads(zlib.decompress(f.read(length)).decode('utf-8'))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM tweets').fetchone()[0]
+
+    def _symbols(self, handle_list):
+        """ Invert the handle list, mapping handles shared by several symbols to None """
+        coins = {}
+        for coin, handle in handle_list.items():
+            coins.setdefault(handle.lower(), []).append(coin)
+        symbols = {}
+        for handle, shared in coins.items():
+            if len(shared) > 1:
+                msg = 'Twitter handle {} is shared by {} - its tweets are archived without a symbol'.format(
+                    handle, sorted(shared))
+                if self.logger is None:
+                    print(msg)
+                else:
+                    self.logger.warning(msg)
+                symbols[handle] = None
+            else:
+                symbols[handle] = shared[0]
+        return symbols
+
+    def _write(self, tweet):
+        """ Append a record to the log and index it. Caller holds the lock and commits. """
+        data = zlib.compress(json.dumps(tweet, separators=(',', ':')).encode('utf-8'))
+        fields = self._index_fields(tweet)  # parse before writing so malformed tweets never reach the log
+        offset = self._log.tell()
+        self._log.write(HEADER.pack(len(data)) + data)
+        self._index(fields, offset + HEADER.size, len(data))
+
+    def _index_fields(self, tweet):
+        handle = tweet['user']['screen_name'].lower()
+        return tweet['id'], handle, self.symbols.get(handle), twitter_epoch(tweet['created_at'])
+
+    def _index(self, fields, offset, length):
+        self._db.execute('INSERT OR IGNORE INTO tweets VALUES (?, ?, ?, ?, ?, ?)', fields + (offset, length))
+
+    def _read(self, f, offset, length):
+        f.seek(offset)
+        return json.loads(zlib.decompress(f.read(length)).decode('utf-8'))
+
+    def _indexed_size(self):
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', ('log size',)).fetchone()
+        return 0 if row is None else row[0]
+
+    def _set_indexed_size(self, size):
+        self._db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('log size', size))
+
+    def _recover(self):
+        """
+        Index records written after the last index commit, drop a torn or corrupt tail from the log and drop
+        index rows that point past the end of the recovered log.
+        """
+        offset = self._indexed_size()
+        log_size = os.path.getsize(self.log_path)
+        if offset == log_size:
+            return
+        if offset > log_size:
+            offset = 0  # index is ahead of the log (lost writes) - rescan the whole log
+        with open(self.log_path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                length, = HEADER.unpack(header)
+                data = f.read(length)
+                if len(data) < length:
+                    break
+                try:
+                    fields = self._index_fields(json.loads(zlib.decompress(data).decode('utf-8')))
+                except (zlib.error, ValueError, KeyError, TypeError):
+                    break  # corrupt record - treat as the end of the log
+                self._index(fields, offset + HEADER.size, length)
+                offset += HEADER.size + length
+        if offset < log_size:
+            self._log.truncate(offset)
+            self._log.seek(0, os.SEEK_END)
+        self._db.execute('DELETE FROM tweets WHERE offset + length > ?', (offset,))
+        self._set_indexed_size(offset)
+        self._db.commit()
+
+
+class TweetReplay:
+    """
+    Twitter client stand-in that serves archived tweets as they would have appeared at the time given by clock.
+    Use with a ReplayClock, e.g. TwitterMonitor(twitter_client=TweetReplay(archive, clock), clock=clock).
+    """
+    def __init__(self, archive, clock):
+        self.archive = archive
+        self.clock = clock
+
+    def get_list_statuses(self, **kwargs):
+        return self.archive.get_list_statuses(until=self.clock(), **kwargs)
@@ -2,7 +2,8 @@ from dateutil import parser
 import pickle
 import os
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
+import time
 from twython import TwythonError
 
 
@@ -12,6 +13,16 @@ def twitter_ts(created_at):
     return parser.parser().parse(created_at[ts_idx: ts_idx + 8])
 
 
+def twitter_epoch(created_at):
+    """Parse twitter timestamp including the date - returns seconds since epoch"""
+    return parser.parse(created_at).timestamp()
+
+
+def twitter_dt(created_at):
+    """Parse twitter timestamp including the date - returns naive UTC datetime object"""
+    return datetime.utcfromtimestamp(twitter_epoch(created_at))
+
+
 def binance_ts(ts):
     """Parse timestamps from ccxt binance client"""
     if isinstance(ts, int) or isinstance(ts, float):
@@ -84,5 +95,15 @@ def make_twitter_list(list_name, creator_handle, client, handles):
         except TwythonError as e:
             print(e)
 
+class ReplayClock:
+    """ Clock that runs in real time from a given start. Pass to TwitterMonitor to replay archived tweets. """
+    def __init__(self, start):
+        self.start = start
+        self._t0 = time.time()
+
+    def __call__(self):
+        return self.start + timedelta(seconds=time.time() - self._t0)
+
+
 class OutOfRangeError(Exception):
     pass
\ No newline at end of file
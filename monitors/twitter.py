@@ -5,19 +5,21 @@ import numpy as np
 import time
 from datetime import datetime
 import pickle
-from private import TWITTER_CLIENT
-from common.util import dt_time_diff, twitter_ts, print_time, last_trade_before_dt, splice_trades, reduce_trades, OutOfRangeError
+from common.util import dt_time_diff, twitter_dt, print_time, last_trade_before_dt, splice_trades, reduce_trades, OutOfRangeError
 from common.logger_config import init_logger, error_msg
 from common.alerts import Alert, check_custom_triggers
+from common.checkpoint import Checkpoint, STATE_PATH, REPLAY_STATE_PATH
+from common.tweet_archive import TweetArchive, TweetReplay
+from common.config import RED_ALERT_GAIN_THRESH, AMBER_ALERT_GAIN_THRESH, MONITOR_INTERVALS, MONITOR_INTERVALS_REDUCED
 
 DATA_LOG_PATH = os.path.join('logs', 'data')
+REPLAY_DATA_LOG_PATH = os.path.join('logs', 'replay', 'data')
 
-RED_ALERT_GAIN_THRESH = {30: 0.6, 60: 1.1, 150: 1.8, 300: 3.0, 600: 5.0}  # interval (seconds) : % gain
-AMBER_ALERT_GAIN_THRESH = {30: 0.4, 60: 0.9, 150: 1.4, 300: 2.5, 600: 4.5}  # interval (seconds) : % gain
 LONG_MA_LEN = 100
 TWITTER_CHECK_INTERVALS = [15, 60]  # seconds - recommended 15 for normal and 60 for reduced
-MONITOR_INTERVALS = [30, 60, 150, 300, 600]  # seconds
-MONITOR_INTERVALS_REDUCED = [60, 300, 600]  # seconds - for longer twitter check intervals
+RESTART_DELAY = 5  # seconds
+CLOCK_SKEW = 5  # seconds - tweets timestamped up to this far ahead of the clock are treated as new
+TWEET_PAGE_SIZE = 200  # max tweets per get_list_statuses call
 
 
 class TwitterMonitor:
@@ -28,9 +30,19 @@ class TwitterMonitor:
     - Amber: audio announcement and print to console
     - Red: audio announcement, print to console and text to user
     Alerts can also be assigned to other signals such as keywords in tweets.
+    Active monitoring sessions and the last tweet seen are checkpointed so the monitor can pick up where it
+    left off after a crash. Replays (a TweetReplay twitter client) keep their own checkpoint and data logs and
+    don't log data or archive tweets unless asked to, so they never touch live state.
     """
-    def __init__(self, client, handle_list, reduced_mode=False, log_data=True, quiet_mode=False, sms=False):
-        self.client = client
+    def __init__(self, client_pool, handle_list, reduced_mode=False, log_data=None, quiet_mode=False, sms=False,
+                 checkpoint=None, archive_tweets=None, log_all=False, twitter_client=None, clock=None):
+        self.client_pool = client_pool  # ClientPool of exchange clients shared between monitor threads
+        if twitter_client is None:
+            from private import TWITTER_CLIENT
+            twitter_client = TWITTER_CLIENT
+        self.twitter_client = twitter_client  # anything with get_list_statuses, e.g. a TweetReplay
+        self.replay = isinstance(twitter_client, TweetReplay)  # replaying archived tweets rather than live
+        self.clock = datetime.utcnow if clock is None else clock  # returns current UTC time - see ReplayClock
         self.handle_list = handle_list
         self.reduced_mode = reduced_mode  # lightweight version with fewer API calls and monitoring intervals
         self.quiet_mode = quiet_mode  # no audio announcements for amber monitors
@@ -39,19 +51,37 @@ class TwitterMonitor:
             self.sms_client = TWILIO_CLIENT  # sends sms msgs for red alerts
         else:
             self.sms_client = None
-        self.log_data = log_data  # set to True to log data for each coin monitored
+        # log data for each coin monitored - defaults to on when live and off when replaying
+        self.log_data = not self.replay if log_data is None else log_data
+        self.data_path = REPLAY_DATA_LOG_PATH if self.replay else DATA_LOG_PATH
+        if self.log_data:
+            os.makedirs(self.data_path, exist_ok=True)
+        self.log_all = log_all  # set to True to also log data for coins that didn't alert (for calibration)
+        self.logger = init_logger('Alerts', 'monitors.log')
+        if checkpoint is None:
+            checkpoint = Checkpoint(REPLAY_STATE_PATH if self.replay else STATE_PATH)
+        elif self.replay and os.path.abspath(checkpoint.path) == os.path.abspath(STATE_PATH):
+            raise ValueError('Replays must not use the live checkpoint {}'.format(STATE_PATH))
+        self.checkpoint = checkpoint  # state file for crash recovery
+        if self.checkpoint.logger is None:
+            self.checkpoint.logger = self.logger
+        # archive every tweet retrieved from the twitter list - defaults to on when live and off when replaying
+        if archive_tweets is None:
+            archive_tweets = not self.replay
+        self.tweet_archive = TweetArchive(handle_list=handle_list, logger=self.logger) if archive_tweets else None
 
         self.refresh_rate = TWITTER_CHECK_INTERVALS[1] if reduced_mode else TWITTER_CHECK_INTERVALS[0]
+        self.intervals = MONITOR_INTERVALS if not reduced_mode else MONITOR_INTERVALS_REDUCED
 
-        self.logger = init_logger('Alerts', 'monitors.log')
         self.thread_count = 0
 
     def main(self):
-        """ Call to main monitor loop. Will restart if there is an exception """
+        """ Call to main monitor loop. Will resume checkpointed sessions and restart if there is an exception """
         self.logger.info('Main monitor started at {} ({} mode with data logging {} and sms msgs {})'.format(
             print_time(), ('reduced' if self.reduced_mode else 'normal'), ('on' if self.log_data else 'off'),
             ('on' if self.sms_client is not None else 'off')))
         self.logger.info('Refreshing twitter every {} seconds'.format(self.refresh_rate))
+        self._resume_sessions()
 
         while True:
             try:
@@ -59,97 +89,144 @@ class TwitterMonitor:
             except Exception as e:
                 self.logger.error(error_msg(e))
                 traceback.print_exc()
-                self.logger.info('Attempting to restart after 60 seconds'.format(print_time()))
-                time.sleep(60)
+                self.logger.info('Attempting to restart after {} seconds'.format(RESTART_DELAY))
+                time.sleep(RESTART_DELAY)
                 self.logger.info('Restarting main monitor')
 
-    def monitor_market(self, symbol, alert=None, logger=None, init_dt=None):
+    def monitor_market(self, symbol, alert=None, logger=None, init_dt=None, session=None):
             """
             Checks the price of a given market at the time intervals given in the MONITOR_INTERVALS variable.
+            Intervals that have already passed (e.g. for backfilled tweets) are skipped and logged as nan gains.
             :param symbol: market symbol
             :param alert: optional custom alert object
             :param logger: optional logger
-            :param init_dt: starting datetime (cannot be bigger than first interval) - defaults to now
+            :param init_dt: starting datetime (cannot be bigger than last interval) - defaults to now
+            :param session: optional checkpointed session to resume (overrides init_dt)
             """
             if logger is None:
                 logger = self.logger
             if alert is None:
                 alert = Alert(symbol, logger=logger)
-            intervals = MONITOR_INTERVALS if not self.reduced_mode else MONITOR_INTERVALS_REDUCED
+            intervals = self.intervals
             pair = symbol + '/BTC'
-            init_trades = self.client.fetch_trades(pair)
 
-            if init_dt is not None:
-                last_trade = last_trade_before_dt(init_trades, init_dt)
+            if session is not None:
+                # trades and order books from before the restart are lost
+                init_dt = session['init time']
+                init_price = session['init price']
+                gains = list(session['gains'])
+                init_trades = None
+                trades_after = None
+                obs = []
             else:
-                last_trade = init_trades[-1]
-                init_dt = datetime.utcnow()
-
-            prev_interval = dt_time_diff(init_dt, datetime.utcnow())
-            assert prev_interval < intervals[0], \
-                'Cannot monitor {}s interval for an initial time of {}'.format(intervals[0], init_dt)
-
-            init_price = last_trade['price']
-            obs = [self.client.fetch_order_book(pair)]
-            gains = []
-            trades_after = [last_trade]
-
-            for i, curr_interval in enumerate(intervals):
-                time.sleep(curr_interval - prev_interval)
-                if trades_after is not None and len(trades_after) < 100:
-                    trades = self.client.fetch_trades(pair)
-                    try:
-                        trades_after = splice_trades(trades_after, trades)
-                    except OutOfRangeError:
-                        logger.warning('trade splicing failed - there may be too many trades to log')
-                        trades_after = None
-
-                obs.append(self.client.fetch_order_book(pair))
-                price = self.client.fetch_ticker(pair)['last']
-                gain_since = 100 * (price / init_price - 1)  # %
-                gains.append(gain_since)
-                logger.info('{}m monitoring of {} complete at {}. Gain = {:.2f}%'.format(
-                    curr_interval / 60, symbol, print_time(), gain_since))
-
-                if gain_since > RED_ALERT_GAIN_THRESH[curr_interval]:
-                    alert.red('large gain', trigger='{}s gain'.format(curr_interval))
-                elif gain_since > AMBER_ALERT_GAIN_THRESH[curr_interval]:
-                    alert.amber('medium gain', trigger='{}s gain'.format(curr_interval))
-                prev_interval = curr_interval
-
-            if self.log_data and alert.curr_tier is not None:
-                # OHLCV should be replaced later
-                ohlcv = np.array(
-                    self.client.fetch_ohlcv(pair, timeframe='1m', limit=int(intervals[-1] / 60) + LONG_MA_LEN))
-
-                if trades_after is not None and not self.reduced_mode:
-                    # 100 trades either side of init dt
-                    trades_log = {'before': reduce_trades(init_trades), 'after': reduce_trades(trades_after)}
+                with self.client_pool.client() as client:
+                    init_trades = client.fetch_trades(pair)
+                    obs = [client.fetch_order_book(pair)]
+
+                if init_dt is not None:
+                    last_trade = last_trade_before_dt(init_trades, init_dt)
                 else:
-                    trades_log = None
-
-                data = {
-                    'init price': init_price,
-                    'symbol': symbol,
-                    'ohlcv': ohlcv,
-                    'trades': trades_log,
-                    'gains': gains,
-                    'order books': obs,
-                    'timestamp': init_dt,
-                    'alert history': alert.export()
-                }
-                pickle.dump(data, open(os.path.join(DATA_LOG_PATH, '{}-{}.p'.format(init_dt, symbol)), 'wb'))
+                    last_trade = init_trades[-1]
+                    init_dt = self.clock()
+                init_price = last_trade['price']
+                gains = []
+                trades_after = [last_trade]
+
+            prev_interval = dt_time_diff(init_dt, self.clock())
+            assert prev_interval < intervals[-1], \
+                'Cannot monitor {}s interval for an initial time of {}'.format(intervals[-1], init_dt)
+
+            key = self._session_key(init_dt, symbol)
+            self.checkpoint.set_session(key, self._session(symbol, init_price, init_dt, gains, alert))
+            try:
+                for i, curr_interval in enumerate(intervals):
+                    if i < len(gains):
+                        continue  # checked before restart
+                    if curr_interval <= prev_interval:
+                        logger.warning('{}s monitoring of {} missed'.format(curr_interval, symbol))
+                        gains.append(float('nan'))
+                        continue
+
+                    time.sleep(curr_interval - prev_interval)
+                    with self.client_pool.client() as client:
+                        if trades_after is not None and len(trades_after) < 100:
+                            trades = client.fetch_trades(pair)
+                            try:
+                                trades_after = splice_trades(trades_after, trades)
+                            except OutOfRangeError:
+                                logger.warning('trade splicing failed - there may be too many trades to log')
+                                trades_after = None
+
+                        obs.append(client.fetch_order_book(pair))
+                        price = client.fetch_ticker(pair)['last']
+                    gain_since = 100 * (price / init_price - 1)  # %
+                    gains.append(gain_since)
+                    logger.info('{}m monitoring of {} complete at {}. Gain = {:.2f}%'.format(
+                        curr_interval / 60, symbol, print_time(), gain_since))
+
+                    if gain_since > RED_ALERT_GAIN_THRESH[curr_interval]:
+                        alert.red('large gain', trigger='{}s gain'.format(curr_interval))
+                    elif gain_since > AMBER_ALERT_GAIN_THRESH[curr_interval]:
+                        alert.amber('medium gain', trigger='{}s gain'.format(curr_interval))
+                    prev_interval = curr_interval
+                    self.checkpoint.set_session(key, self._session(symbol, init_price, init_dt, gains, alert))
+
+                if self.log_data and (alert.curr_tier is not None or self.log_all):
+                    # OHLCV should be replaced later
+                    with self.client_pool.client() as client:
+                        ohlcv = np.array(
+                            client.fetch_ohlcv(pair, timeframe='1m', limit=int(intervals[-1] / 60) + LONG_MA_LEN))
+
+                    if trades_after is not None and not self.reduced_mode:
+                        # 100 trades either side of init dt
+                        trades_log = {'before': reduce_trades(init_trades), 'after': reduce_trades(trades_after)}
+                    else:
+                        trades_log = None
+
+                    data = {
+                        'init price': init_price,
+                        'symbol': symbol,
+                        'ohlcv': ohlcv,
+                        'trades': trades_log,
+                        'gains': gains,
+                        'intervals': intervals,
+                        'log all': self.log_all,
+                        'order books': obs,
+                        'timestamp': init_dt,
+                        'alert history': alert.export()
+                    }
+                    pickle.dump(data, open(os.path.join(self.data_path, '{}.p'.format(key)), 'wb'))
+            finally:
+                self.checkpoint.remove_session(key)
 
     def _main(self):
         """ Main monitor loop """
+        if self.checkpoint.cursor is not None:
+            # backfill tweets posted since the last checkpoint without waiting for the next refresh
+            self._check_tweets(max_age=self.intervals[-1])
         while True:
             time.sleep(self.refresh_rate - time.time() % self.refresh_rate)
-            tweets = TWITTER_CLIENT.get_list_statuses(slug='binance-coins', owner_screen_name='tundra_beats')
-            # LOGGER.debug('Retrieved tweets')
-            for tweet in tweets:
-                tweet_dt = twitter_ts(tweet['created_at'])
-                time_since = dt_time_diff(tweet_dt, datetime.utcnow())
-                if 0 <= time_since < self.refresh_rate:
+            self._check_tweets(max_age=self.refresh_rate)
+
+    def _check_tweets(self, max_age):
+        """
+        Starts a monitor thread for each new tweet, then checkpoints state. Sessions are registered before the
+        tweet cursor moves past them and state is saved even if fetching tweets fails.
+        :param max_age: ignore tweets older than this (seconds)
+        """
+        try:
+            tweets = self._fetch_tweets()
+            cursor = self.checkpoint.cursor
+            blocked = False  # set by a tweet too far ahead of the clock - the cursor can't move past it yet
+            for tweet in sorted(tweets, key=lambda t: t['id']):
+                if cursor is not None and tweet['id'] <= cursor:
+                    continue
+                tweet_dt = twitter_dt(tweet['created_at'])
+                time_since = dt_time_diff(tweet_dt, self.clock())
+                if time_since < -CLOCK_SKEW:
+                    blocked = True
+                    continue
+                if time_since < max_age:
                     handle = tweet['user']['screen_name'].lower()
                     symbol = [coin for coin, name in self.handle_list.items() if name == handle]
                     if not symbol or len(symbol) > 1:
@@ -157,18 +234,72 @@ class TwitterMonitor:
                             symbol, handle))
                     else:
                         symbol = symbol[0]
-                        self.thread_count += 1  # make a new thread
-                        t = threading.Thread(
-                            target=self._new_monitor_thread,
-                            args=(symbol, handle, tweet, tweet_dt))
-                        t.start()
-                else:
-                    break
+                        key = self._session_key(tweet_dt, symbol)
+                        if not self.checkpoint.has_session(key):  # may already be monitored after a retry
+                            self.checkpoint.set_session(
+                                key, self._pending_session(symbol, handle, tweet, tweet_dt))
+                            self._start_thread(self._new_monitor, symbol, handle, tweet, tweet_dt)
+                if not blocked:
+                    self.checkpoint.set_cursor(tweet['id'])
+            if self.tweet_archive is not None:
+                # archive after threads have started - archiving must never hold up or break alerting
+                try:
+                    self.tweet_archive.extend(tweets)
+                except Exception as e:
+                    self.logger.error('Tweet archiving failed: {}'.format(error_msg(e)))
+        finally:
+            self.checkpoint.save()
 
-    def _new_monitor_thread(self, symbol, handle, tweet, tweet_dt):
-        thread_logger = init_logger('Thread {}'.format(self.thread_count), 'monitors.log')
-        thread_logger.info(
-            'Monitoring {} tweet posted at {}'.format(symbol, tweet_dt.time().strftime('%H:%M:%S')))
+    def _fetch_tweets(self):
+        """
+        Fetches new tweets from the twitter list, newest first. Once there is a cursor, every tweet since it is
+        fetched by paging back with max_id, so a burst bigger than one page isn't lost.
+        """
+        kwargs = {'slug': 'binance-coins', 'owner_screen_name': 'tundra_beats'}
+        if self.checkpoint.cursor is None:
+            return self.twitter_client.get_list_statuses(**kwargs)
+        tweets = []
+        while True:
+            if tweets:
+                kwargs['max_id'] = tweets[-1]['id'] - 1
+            page = self.twitter_client.get_list_statuses(
+                since_id=self.checkpoint.cursor, count=TWEET_PAGE_SIZE, **kwargs)
+            page = [t for t in page if not tweets or t['id'] < tweets[-1]['id']]
+            if not page:
+                return tweets
+            tweets.extend(page)
+
+    def _resume_sessions(self):
+        """ Restart monitor threads for any sessions that were in flight when the last checkpoint was saved """
+        if not self.checkpoint.load():
+            return
+        sessions = self.checkpoint.active_sessions()
+        self.logger.info('Resuming {} monitoring sessions from checkpoint'.format(len(sessions)))
+        for session in sessions:
+            if dt_time_diff(session['init time'], self.clock()) >= self.intervals[-1]:
+                self.logger.warning('Dropping expired {} session from {}'.format(
+                    session['symbol'], session['init time']))
+                self.checkpoint.remove_session(self._session_key(session['init time'], session['symbol']))
+                continue
+            self._start_thread(self._resume_monitor, session)
+
+    def _start_thread(self, target, *args):
+        """ Runs target(*args, logger=thread_logger) in a new monitor thread """
+        self.thread_count += 1
+        t = threading.Thread(target=self._run_thread, args=(self.thread_count, target) + args)
+        t.start()
+
+    def _run_thread(self, thread_num, target, *args):
+        thread_logger = init_logger('Thread {}'.format(thread_num), 'monitors.log')
+        try:
+            target(*args, logger=thread_logger)
+        except Exception as e:
+            traceback.print_exc()
+            thread_logger.error(error_msg(e))
+        thread_logger.debug('Client pool stats: {}'.format(self.client_pool.stats()))
+
+    def _new_monitor(self, symbol, handle, tweet, tweet_dt, logger):
+        logger.info('Monitoring {} tweet posted at {}'.format(symbol, tweet_dt.time().strftime('%H:%M:%S')))
 
         txt = tweet['text']
         alert = Alert(
@@ -177,20 +308,58 @@ class TwitterMonitor:
             url=tweet['entities']['urls'][-1]['url'] if tweet['entities']['urls'] else None,
             quiet_mode=self.quiet_mode,
             sms_client=self.sms_client,
-            logger=thread_logger
+            logger=logger
         )
         try:
             triggers = check_custom_triggers(handle, txt)
             for trigger in triggers:
                 alert.alert(trigger['msg'], level=trigger['level'], trigger=trigger['msg'])
-            self.monitor_market(symbol, alert=alert, logger=thread_logger, init_dt=tweet_dt)
-        except Exception as e:
-            traceback.print_exc()
-            thread_logger.error(error_msg(e))
-
-
+            self.monitor_market(symbol, alert=alert, logger=logger, init_dt=tweet_dt)
+        finally:
+            self.checkpoint.remove_session(self._session_key(tweet_dt, symbol))  # in case monitoring never started
 
+    def _resume_monitor(self, session, logger):
+        symbol = session['symbol']
+        if session['init price'] is None:
+            # checkpointed before monitoring started - start from the tweet again
+            self._new_monitor(symbol, session['handle'], session['tweet'], session['init time'], logger)
+            return
+        logger.info('Resuming {} monitoring started at {}'.format(
+            symbol, session['init time'].time().strftime('%H:%M:%S')))
 
+        alert = Alert.from_export(
+            symbol,
+            session['alert history'],
+            quiet_mode=self.quiet_mode,
+            sms_client=self.sms_client,
+            logger=logger
+        )
+        self.monitor_market(symbol, alert=alert, logger=logger, session=session)
 
+    @staticmethod
+    def _session_key(init_dt, symbol):
+        return '{}-{}'.format(init_dt, symbol)
 
+    @staticmethod
+    def _pending_session(symbol, handle, tweet, tweet_dt):
+        """ Checkpoint record for a tweet whose monitor thread hasn't started monitoring yet """
+        return {
+            'symbol': symbol,
+            'init price': None,
+            'init time': tweet_dt,
+            'gains': [],
+            'alert history': None,
+            'handle': handle,
+            'tweet': tweet
+        }
 
+    @staticmethod
+    def _session(symbol, init_price, init_dt, gains, alert):
+        """ Checkpoint record for an active monitoring session """
+        return {
+            'symbol': symbol,
+            'init price': init_price,
+            'init time': init_dt,
+            'gains': list(gains),
+            'alert history': dict(alert.export(), history=list(alert.history))
+        }
@@ -0,0 +1,25 @@
+import argparse
+from common.calibration import calibrate, INTERVALS, THRESHOLDS, TARGET_GAIN, DATA_LOG_PATH
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep alert gain thresholds over logged monitor events')
+    parser.add_argument('--path', default=DATA_LOG_PATH, help='directory of logged events')
+    parser.add_argument('--workers', type=int, default=None, help='number of loader processes')
+    parser.add_argument('--target', type=float, default=TARGET_GAIN, help='peak %% gain that counts as a real pump')
+    parser.add_argument('--min-alerts', type=int, default=1, help='minimum alerts for a recommended threshold')
+    args = parser.parse_args()
+
+    report = calibrate(args.path, workers=args.workers, target_gain=args.target, min_alerts=args.min_alerts)
+    results = report['results']
+    print('{} events, {} with peak gain >= {}%'.format(report['events'], report['positives'], args.target))
+    if not report['unbiased']:
+        print('Some events were logged without log_all - thresholds below the current amber table are excluded')
+    for k, interval in enumerate(INTERVALS):
+        print('\n{}s interval'.format(interval))
+        print('thresh  alerts  precision  recall')
+        for t, thresh in enumerate(THRESHOLDS):
+            if results['alerts'][t, k]:
+                print('{:6.1f}  {:6d}  {:9.2f}  {:6.2f}'.format(
+                    thresh, results['alerts'][t, k], results['precision'][t, k], results['recall'][t, k]))
+    print('\nRED_ALERT_GAIN_THRESH = {}'.format(report['red']))
+    print('AMBER_ALERT_GAIN_THRESH = {}'.format(report['amber']))
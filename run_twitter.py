@@ -1,9 +1,10 @@
 import ccxt
+from common.clients import ClientPool
 from monitors.twitter import TwitterMonitor
 from common.dicts import BINANCE_BTC_MARKETS_TWITTER
 
 binance_monitor = TwitterMonitor(
-    client=ccxt.binance(),
+    client_pool=ClientPool(ccxt.binance, size=4),
     handle_list=BINANCE_BTC_MARKETS_TWITTER,
     reduced_mode=False,
     log_data=True,
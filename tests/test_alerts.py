@@ -10,6 +10,14 @@ class TestAlert(TestCase):
     def test_base(self):
         self.assertEqual(self.alert._base('MSG', 'amber', None), 'MSG for SYMBOL\nTweet text: TXT')
 
+    def test_from_export(self):
+        alert = Alert('SYMBOL', 'TXT', 'URL', quiet_mode=True)
+        alert.amber('MSG', trigger='amber trigger')
+        alert.red('MSG', trigger='red trigger')
+        restored = Alert.from_export('SYMBOL', alert.export())
+        self.assertEqual(alert.export(), restored.export())
+        self.assertEqual('red', restored.curr_tier)
+
 
 class TestCheckCustomTargets(TestCase):
 
@@ -0,0 +1,81 @@
+import os
+import pickle
+import tempfile
+import numpy as np
+from datetime import datetime
+from unittest import TestCase
+from common.calibration import load_events, peak_gains, sweep, recommend, calibrate
+from common.config import AMBER_ALERT_GAIN_THRESH
+
+
+class TestLoadEvents(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.paths = []
+        events = [
+            {'gains': [0.5, 1.0, 2.0, 3.0, 6.0], 'intervals': [30, 60, 150, 300, 600], 'trades': None},
+            {'gains': [1.0, 3.0, 4.0], 'trades': {'after': [{'price': 1.0}, {'price': 1.1}]}}  # reduced mode
+        ]
+        for i, event in enumerate(events):
+            event.update({'symbol': 'ETH', 'timestamp': datetime(2018, 4, 17, 23, 43, 44), 'init price': 1.0,
+                          'ohlcv': [[1524008580000, 1.0, 1.2, 0.9, 1.1, 10.0]] * (i + 1)})
+            path = os.path.join(self.tmp_dir.name, '{}.p'.format(i))
+            with open(path, 'wb') as f:
+                pickle.dump(event, f)
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_stacking(self):
+        events = load_events(self.paths, workers=2)
+        np.testing.assert_array_equal([[0.5, 1.0, 2.0, 3.0, 6.0], [np.nan, 1.0, np.nan, 3.0, 4.0]], events['gains'])
+        self.assertEqual((2, 2, 6), events['ohlcv'].shape)
+        self.assertTrue(np.isnan(events['ohlcv'][0, 1]).all())
+        np.testing.assert_array_equal([[np.nan, np.nan], [1.0, 1.1]], events['trade prices'])
+
+    def test_peak_gains(self):
+        np.testing.assert_allclose([20.0, 20.0], peak_gains(load_events(self.paths, workers=1)))
+
+    def test_calibrate(self):
+        report = calibrate(self.tmp_dir.name, workers=1)
+        self.assertFalse(report['unbiased'])
+        for interval, thresh in report['amber'].items():
+            self.assertGreaterEqual(thresh, AMBER_ALERT_GAIN_THRESH[interval])
+            self.assertLess(thresh, report['red'][interval])
+
+
+class TestSweep(TestCase):
+
+    def setUp(self):
+        self.gains = np.array([[0.5, 6.0], [2.0, 1.0], [np.nan, 5.5], [3.0, 0.2]])
+        self.labels = np.array([True, False, True, True])
+        self.thresholds = np.array([1.0, 2.5, 5.0])
+
+    def test_counts(self):
+        results = sweep(self.gains, self.labels, self.thresholds)
+        np.testing.assert_array_equal([[2, 2], [1, 2], [0, 2]], results['alerts'])
+        np.testing.assert_array_equal([[1, 2], [1, 2], [0, 2]], results['true positives'])
+        np.testing.assert_allclose([[0.5, 1.0], [1.0, 1.0], [np.nan, 1.0]], results['precision'])
+        np.testing.assert_allclose([[1 / 3, 2 / 3], [1 / 3, 2 / 3], [0, 2 / 3]], results['recall'])
+
+    def test_recommend(self):
+        results = sweep(self.gains, self.labels, self.thresholds)
+        self.assertEqual({30: 2.5, 60: 1.0}, recommend(results, self.thresholds, intervals=[30, 60]))
+        self.assertEqual({30: 5.0, 60: 5.0}, recommend(results, self.thresholds, intervals=[30, 60], min_alerts=3))
+
+    def test_recommend_default(self):
+        results = sweep(self.gains, self.labels, self.thresholds)
+        default = {30: 1.5, 60: 9.0}
+        self.assertEqual({30: 1.5, 60: 9.0}, recommend(results, self.thresholds, intervals=[30, 60], min_alerts=3,
+                                                      default=default))
+        # default outside the bounds falls back to the largest allowed candidate
+        self.assertEqual({30: 1.5, 60: 2.5}, recommend(results, self.thresholds, intervals=[30, 60], min_alerts=3,
+                                                      high={30: 5.0, 60: 5.0}, default=default))
+
+    def test_recommend_bounds(self):
+        results = sweep(self.gains, self.labels, self.thresholds)
+        bounded = recommend(results, self.thresholds, intervals=[30, 60], low={30: 1.0, 60: 2.5},
+                            high={30: 2.5, 60: 5.0})
+        self.assertEqual({30: 1.0, 60: 2.5}, bounded)
@@ -0,0 +1,56 @@
+import os
+import tempfile
+from datetime import datetime
+from unittest import TestCase, mock
+from common.checkpoint import Checkpoint
+
+
+class TestCheckpoint(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'state', 'monitor.p')
+        self.session = {'symbol': 'ETH', 'init price': 0.05, 'init time': datetime(2018, 4, 17, 23, 43, 44),
+                        'gains': [0.5, 1.2], 'alert history': {'history': [], 'txt': None, 'url': None}}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.set_session('key', self.session)
+        checkpoint.set_cursor(100)
+        checkpoint.save()
+        loaded = Checkpoint(self.path)
+        self.assertTrue(loaded.load())
+        self.assertEqual([self.session], loaded.active_sessions())
+        self.assertEqual(100, loaded.cursor)
+
+    def test_no_state(self):
+        self.assertFalse(Checkpoint(self.path).load())
+
+    def test_remove_session(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.set_session('key', self.session)
+        checkpoint.remove_session('key')
+        checkpoint.remove_session('missing')
+        self.assertEqual([], checkpoint.active_sessions())
+
+    def test_cursor_only_advances(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.set_cursor(100)
+        checkpoint.set_cursor(50)
+        self.assertEqual(100, checkpoint.cursor)
+
+    def test_corrupt_state(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as f:
+            f.write(b'\x80\x04')  # truncated pickle
+        checkpoint = Checkpoint(self.path, logger=mock.Mock())
+        self.assertFalse(checkpoint.load())
+        self.assertTrue(checkpoint.logger.error.called)
+        self.assertEqual([], checkpoint.active_sessions())
+        self.assertTrue(os.path.exists(self.path + '.corrupt'))
+        checkpoint.set_cursor(1)
+        checkpoint.save()
+        self.assertTrue(Checkpoint(self.path).load())
@@ -0,0 +1,85 @@
+import threading
+import time
+from unittest import TestCase
+from common.clients import ClientPool, RateLimiter, PoolExhaustedError
+
+
+class FakeExchange:
+    rateLimit = 50
+
+    def __init__(self, config):
+        self.config = config
+        self.markets = None
+        self.currencies = None
+        self.load_count = 0
+
+    def load_markets(self, reload=False):
+        self.load_count += 1
+        self.markets = {'ETH/BTC': {}}
+        self.currencies = {'ETH': {}, 'BTC': {}}
+        return self.markets
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = markets
+        self.currencies = currencies
+
+
+class TestClientPool(TestCase):
+
+    def setUp(self):
+        self.pool = ClientPool(FakeExchange, size=2, timeout=0.01)
+
+    def test_config(self):
+        self.assertTrue(all(client.config['enableRateLimit'] for client in self.pool.clients))
+
+    def test_shared_markets(self):
+        with self.pool.client():
+            pass
+        self.assertEqual(1, sum(client.load_count for client in self.pool.clients))
+        self.assertTrue(all(client.markets == {'ETH/BTC': {}} for client in self.pool.clients))
+
+    def test_distinct_clients(self):
+        with self.pool.client() as c0, self.pool.client() as c1:
+            self.assertIsNot(c0, c1)
+            self.assertEqual(2, self.pool.stats()['in use'])
+        self.assertEqual(0, self.pool.stats()['in use'])
+
+    def test_exhausted(self):
+        with self.pool.client(), self.pool.client():
+            self.assertRaises(PoolExhaustedError, self.pool.acquire)
+
+    def test_shared_rate_limiter(self):
+        self.assertTrue(all(client.throttle == self.pool.rate_limiter.throttle for client in self.pool.clients))
+        self.assertEqual(50, self.pool.rate_limiter.rate_limit)
+
+    def test_stats(self):
+        pool = ClientPool(FakeExchange, size=1)
+        client = pool.acquire()
+        t = threading.Thread(target=lambda: pool.release(pool.acquire()))
+        t.start()
+        pool.release(client)
+        t.join()
+        stats = pool.stats()
+        self.assertEqual(2, stats['checkouts'])
+        self.assertEqual(1, stats['peak in use'])
+        self.assertEqual(0, stats['in use'])
+
+
+class TestRateLimiter(TestCase):
+
+    def test_spacing(self):
+        limiter = RateLimiter(20)
+        threads = [threading.Thread(target=limiter.throttle) for _ in range(4)]
+        t0 = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertGreaterEqual(time.time() - t0, 0.055)  # 3 waits of 20ms after the first request
+
+    def test_cost(self):
+        limiter = RateLimiter(20)
+        limiter.throttle(cost=5)
+        t0 = time.time()
+        limiter.throttle()
+        self.assertGreaterEqual(time.time() - t0, 0.09)
@@ -0,0 +1,111 @@
+import os
+import copy
+import pickle
+import tempfile
+from datetime import datetime
+from unittest import TestCase, mock
+from common.tweet_archive import TweetArchive
+
+
+class TestTweetArchive(TestCase):
+
+    def setUp(self):
+        with open(os.path.join(os.path.dirname(__file__), 'tweet.p'), 'rb') as f:
+            self.tweet = pickle.load(f)  # zcoinofficial - Sun Mar 25 16:40:59 +0000 2018
+        self.later = copy.deepcopy(self.tweet)
+        self.later['id'] += 1
+        self.later['created_at'] = 'Sun Mar 25 18:00:00 +0000 2018'
+        self.later['user']['screen_name'] = 'Binance'
+        self.later['text'] = 'Binance lists a new coin'
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.archive = TweetArchive(self.tmp_dir.name, handle_list={'XZC': 'zcoinofficial', 'BNB': 'binance'})
+        self.archive.extend([self.tweet, self.later])
+
+    def tearDown(self):
+        self.archive.close()
+        self.tmp_dir.cleanup()
+
+    def test_no_duplicates(self):
+        self.assertFalse(self.archive.append(self.tweet))
+        self.assertEqual(2, len(self.archive))
+
+    def test_get(self):
+        self.assertEqual(self.tweet, self.archive.get(self.tweet['id']))
+        self.assertIsNone(self.archive.get(0))
+
+    def test_query(self):
+        self.assertEqual([self.tweet], list(self.archive.query(symbol='XZC')))
+        self.assertEqual([self.later], list(self.archive.query(handle='binance')))
+        self.assertEqual([self.tweet], list(self.archive.query(end=datetime(2018, 3, 25, 17))))
+        self.assertEqual([self.later], list(self.archive.query(start=datetime(2018, 3, 25, 17))))
+        self.assertEqual([self.later, self.tweet], list(self.archive.query(reverse=True)))
+
+    def test_iter(self):
+        self.assertEqual([self.tweet, self.later], list(self.archive))
+
+    def test_get_list_statuses(self):
+        self.assertEqual([self.later, self.tweet], self.archive.get_list_statuses(slug='binance-coins'))
+        self.assertEqual([self.later], self.archive.get_list_statuses(since_id=self.tweet['id']))
+        self.assertEqual([self.tweet], self.archive.get_list_statuses(max_id=self.tweet['id']))
+        self.assertEqual([self.tweet], self.archive.get_list_statuses(until=datetime(2018, 3, 25, 17)))
+
+    def test_check_triggers(self):
+        matches = self.archive.check_triggers()
+        self.assertEqual(1, len(matches))
+        self.assertEqual(self.later, matches[0][0])
+
+    def test_recover(self):
+        self.archive.close()
+        with open(self.archive.log_path, 'ab') as f:
+            f.write(b'\x10\x00')  # partially written record
+        self.archive = TweetArchive(self.tmp_dir.name)
+        self.assertEqual([self.tweet, self.later], list(self.archive))
+        self.assertTrue(self.archive.append(dict(self.later, id=self.later['id'] + 1)))
+        self.assertEqual(3, len(list(self.archive)))
+
+    def test_recover_corrupt_record(self):
+        self.archive.close()
+        with open(self.archive.log_path, 'ab') as f:
+            f.write(b'\x04\x00\x00\x00junk')  # full length header with garbage data
+        self.archive = TweetArchive(self.tmp_dir.name)
+        self.assertEqual([self.tweet, self.later], list(self.archive))
+
+    def test_recover_index_ahead_of_log(self):
+        self.archive.close()
+        with open(self.archive.log_path, 'rb') as f:
+            data = f.read()
+        with open(self.archive.log_path, 'wb') as f:
+            f.write(data[:-10])  # last record lost after the index was committed
+        self.archive = TweetArchive(self.tmp_dir.name)
+        self.assertEqual(1, len(self.archive))
+        self.assertIsNone(self.archive.get(self.later['id']))
+        self.assertEqual([self.tweet], list(self.archive))
+
+    def test_malformed_tweet(self):
+        bad = dict(self.later, id=self.later['id'] + 1, created_at='not a date')
+        self.assertRaises(ValueError, self.archive.extend, [dict(self.later, id=self.later['id'] + 2), bad])
+        self.assertEqual(2, len(self.archive))
+        self.assertEqual([self.tweet, self.later], list(self.archive))
+
+    def test_read_only(self):
+        with open(self.archive.log_path, 'ab') as f:
+            f.write(b'\x10\x00')  # a write in progress by the live archive
+        size = os.path.getsize(self.archive.log_path)
+        reader = TweetArchive(self.tmp_dir.name, read_only=True)
+        try:
+            self.assertEqual(size, os.path.getsize(self.archive.log_path))
+            self.assertEqual([self.tweet, self.later], list(reader))
+            self.assertEqual([self.tweet], list(reader.query(handle='zcoinofficial')))
+            self.assertRaises(PermissionError, reader.append, dict(self.later, id=self.later['id'] + 1))
+        finally:
+            reader.close()
+
+    def test_shared_handle(self):
+        self.archive.close()
+        self.archive = TweetArchive(os.path.join(self.tmp_dir.name, 'shared'), logger=mock.Mock(),
+                                    handle_list={'VEN': 'zcoinofficial', 'VET': 'zcoinofficial'})
+        self.assertTrue(self.archive.logger.warning.called)
+        self.archive.append(self.tweet)
+        self.assertEqual([], list(self.archive.query(symbol='VEN')))
+        self.assertEqual([], list(self.archive.query(symbol='VET')))
+        self.assertEqual([self.tweet], list(self.archive.query(handle='zcoinofficial')))
@@ -0,0 +1,288 @@
+import math
+import os
+import pickle
+import tempfile
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase, mock
+from common.alerts import Alert
+from common.checkpoint import Checkpoint, REPLAY_STATE_PATH
+from common.clients import ClientPool
+from common.tweet_archive import TweetArchive, TweetReplay
+from monitors.twitter import TwitterMonitor, DATA_LOG_PATH, REPLAY_DATA_LOG_PATH
+
+START = datetime(2018, 3, 25, 16, 41, 0)
+HANDLES = {'XZC': 'zcoinofficial', 'NEO': 'neo_blockchain'}
+
+
+def make_tweet(tweet_id, dt, handle='zcoinofficial', text='hello'):
+    return {'id': tweet_id, 'created_at': dt.strftime('%a %b %d %H:%M:%S +0000 %Y'), 'text': text,
+            'user': {'screen_name': handle}, 'entities': {'urls': []}}
+
+
+class FakeClock:
+    """ Clock that only moves when the monitor sleeps """
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+
+class FakeExchange:
+    rateLimit = 0
+
+    def __init__(self, config):
+        self.currencies = {}
+
+    def load_markets(self, reload=False):
+        return {}
+
+    def set_markets(self, markets, currencies=None):
+        pass
+
+    def fetch_trades(self, pair):
+        ts = (START - timedelta(minutes=5)).replace(tzinfo=timezone.utc).timestamp() * 1000
+        return [{'timestamp': ts, 'price': 1.0, 'amount': 1.0, 'cost': 1.0}]
+
+    def fetch_order_book(self, pair):
+        return {'bids': [], 'asks': []}
+
+    def fetch_ticker(self, pair):
+        return {'last': 1.1}  # 10% gain at every interval
+
+    def fetch_ohlcv(self, pair, timeframe='1m', limit=None):
+        return [[0, 1.0, 1.1, 1.0, 1.1, 1.0]]
+
+
+class FakeTwitter:
+
+    def __init__(self, tweets, fail_after=None):
+        self.tweets = tweets  # newest first
+        self.fail_after = fail_after  # number of successful calls before twitter goes down
+        self.calls = []
+
+    def get_list_statuses(self, since_id=None, max_id=None, count=20, **kwargs):
+        self.calls.append(since_id)
+        if self.fail_after is not None and len(self.calls) > self.fail_after:
+            raise ConnectionError('twitter is down')
+        return [t for t in self.tweets
+                if (since_id is None or t['id'] > since_id) and (max_id is None or t['id'] <= max_id)][:count]
+
+
+class DeferredThread:
+    """ Collects monitor threads so tests can run them one at a time """
+    started = []
+
+    def __init__(self, target, args=()):
+        self.target = target
+        self.args = args
+
+    def start(self):
+        DeferredThread.started.append(self)
+
+    def run(self):
+        self.target(*self.args)
+
+
+class MonitorTestCase(TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        for path in ('runtime', 'data'):
+            os.makedirs(os.path.join('logs', path))
+        self.clock = FakeClock(START)
+        self.state_path = os.path.join('logs', 'state', 'monitor.p')
+        DeferredThread.started = []
+        patches = [mock.patch('monitors.twitter.time.sleep', self.clock.sleep),
+                   mock.patch('monitors.twitter.threading.Thread', DeferredThread)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def make_monitor(self, twitter_client, **kwargs):
+        kwargs.setdefault('archive_tweets', False)
+        kwargs.setdefault('checkpoint', Checkpoint(self.state_path))
+        return TwitterMonitor(ClientPool(FakeExchange, size=1), HANDLES, quiet_mode=True,
+                              twitter_client=twitter_client, clock=self.clock, **kwargs)
+
+    def run_threads(self):
+        threads, DeferredThread.started = DeferredThread.started, []
+        for t in threads:
+            t.run()
+        return threads
+
+    def checkpoint_cursor(self, monitor):
+        return self.saved_checkpoint(monitor.checkpoint.path).cursor
+
+    def saved_checkpoint(self, path=None):
+        saved = Checkpoint(self.state_path if path is None else path)
+        saved.load()
+        return saved
+
+    def logged_gains(self, path=DATA_LOG_PATH):
+        gains = []
+        for name in sorted(os.listdir(path)):
+            with open(os.path.join(path, name), 'rb') as f:
+                gains.append(pickle.load(f)['gains'])
+        return gains
+
+
+class TestReplay(MonitorTestCase):
+
+    def make_replay(self):
+        archive = TweetArchive(os.path.join('logs', 'tweets'), handle_list=HANDLES)
+        self.addCleanup(archive.close)
+        past = make_tweet(1, START - timedelta(seconds=10))
+        future = make_tweet(2, START + timedelta(seconds=60), handle='neo_blockchain')
+        archive.extend([past, future])
+        return TweetReplay(archive, self.clock)
+
+    def test_replay_from_archive(self):
+        monitor = self.make_monitor(self.make_replay(), checkpoint=None, log_data=True)
+
+        monitor._check_tweets(max_age=15)
+        self.assertEqual(REPLAY_STATE_PATH, monitor.checkpoint.path)
+        self.assertEqual(1, self.checkpoint_cursor(monitor))
+        self.assertEqual(1, len(self.run_threads()))
+        self.assertEqual([[10.0] * 5],
+                         [[round(g, 6) for g in gains] for gains in self.logged_gains(REPLAY_DATA_LOG_PATH)])
+        self.assertFalse(os.path.exists(self.state_path))
+        self.assertEqual([], os.listdir(DATA_LOG_PATH))
+
+    def test_replay_defaults(self):
+        monitor = TwitterMonitor(ClientPool(FakeExchange, size=1), HANDLES, quiet_mode=True,
+                                 twitter_client=self.make_replay(), clock=self.clock)
+        self.assertFalse(monitor.log_data)
+        self.assertIsNone(monitor.tweet_archive)
+        self.assertRaises(ValueError, self.make_monitor, self.make_replay())  # live checkpoint
+
+    def test_archive_failure_does_not_block_alerts(self):
+        monitor = self.make_monitor(FakeTwitter([make_tweet(1, START - timedelta(seconds=5))]))
+        monitor.tweet_archive = mock.Mock()
+        monitor.tweet_archive.extend.side_effect = OSError('disk full')
+
+        monitor._check_tweets(max_age=15)
+        self.assertEqual(1, len(DeferredThread.started))
+        self.assertEqual(1, self.checkpoint_cursor(monitor))
+
+
+class TestCrashRecovery(MonitorTestCase):
+
+    def session(self, age, gains):
+        return {'symbol': 'XZC', 'init price': 1.0, 'init time': START - timedelta(seconds=age), 'gains': gains,
+                'alert history': Alert('XZC', quiet_mode=True).export()}
+
+    def save_state(self, sessions=(), cursor=None):
+        checkpoint = Checkpoint(self.state_path)
+        for session in sessions:
+            checkpoint.set_session(TwitterMonitor._session_key(session['init time'], session['symbol']), session)
+        if cursor is not None:
+            checkpoint.set_cursor(cursor)
+        checkpoint.save(force=True)
+
+    def test_sessions_saved_with_cursor(self):
+        tweets = [make_tweet(2, START - timedelta(seconds=5), handle='neo_blockchain'),
+                  make_tweet(1, START - timedelta(seconds=10))]
+        monitor = self.make_monitor(FakeTwitter(tweets))
+        monitor._check_tweets(max_age=15)  # threads started but not run - as if the process died here
+        saved = self.saved_checkpoint()
+        self.assertEqual(2, saved.cursor)
+        self.assertEqual({'NEO', 'XZC'}, {session['symbol'] for session in saved.active_sessions()})
+
+    def test_resume_pending_session(self):
+        monitor = self.make_monitor(FakeTwitter([make_tweet(1, START - timedelta(seconds=5))]))
+        monitor._check_tweets(max_age=15)
+        DeferredThread.started = []  # crash before the monitor thread fetched any prices
+
+        monitor = self.make_monitor(FakeTwitter([]))
+        monitor._resume_sessions()
+        self.assertEqual(1, len(self.run_threads()))
+        self.assertEqual([[10.0] * 5], [[round(g, 6) for g in gains] for gains in self.logged_gains()])
+        self.assertEqual([], monitor.checkpoint.active_sessions())
+
+    def test_resume_session(self):
+        self.save_state([self.session(age=100, gains=[2.0])])
+        monitor = self.make_monitor(FakeTwitter([]))
+        monitor._resume_sessions()
+        self.run_threads()
+        gains, = self.logged_gains()
+        self.assertEqual(2.0, gains[0])
+        self.assertTrue(math.isnan(gains[1]))  # 60s interval passed while the monitor was down
+        self.assertEqual([10.0] * 3, [round(g, 6) for g in gains[2:]])
+        self.assertEqual([], monitor.checkpoint.active_sessions())
+
+    def test_expired_session_dropped(self):
+        self.save_state([self.session(age=700, gains=[2.0, 3.0])])
+        monitor = self.make_monitor(FakeTwitter([]))
+        monitor._resume_sessions()
+        self.assertEqual([], DeferredThread.started)
+        self.assertEqual([], monitor.checkpoint.active_sessions())
+
+    def test_backfill(self):
+        self.save_state(cursor=1)
+        tweets = [make_tweet(3, START - timedelta(seconds=40)),
+                  make_tweet(2, START - timedelta(seconds=20), handle='neo_blockchain'),
+                  make_tweet(1, START - timedelta(seconds=30))]
+        twitter = FakeTwitter(tweets, fail_after=2)
+        monitor = self.make_monitor(twitter)
+        monitor.checkpoint.load()
+        self.assertRaises(ConnectionError, monitor._main)
+        self.assertEqual([1, 1, 3], twitter.calls)  # backfill (2 pages) ran before the first refresh sleep
+        # thread args are (thread num, target, symbol, handle, tweet, tweet dt)
+        self.assertEqual([2, 3], [t.args[4]['id'] for t in DeferredThread.started])
+        self.assertEqual(3, self.checkpoint_cursor(monitor))
+
+        DeferredThread.started = DeferredThread.started[1:]
+        self.run_threads()
+        gains, = self.logged_gains()
+        self.assertTrue(math.isnan(gains[0]))  # 30s interval had passed before the tweet was seen
+        self.assertEqual([10.0] * 4, [round(g, 6) for g in gains[1:]])
+
+    def test_save_when_fetch_fails(self):
+        monitor = self.make_monitor(FakeTwitter([], fail_after=0))
+        monitor.checkpoint.set_session('key', self.session(age=100, gains=[2.0, 3.0]))
+        self.assertRaises(ConnectionError, monitor._check_tweets, 15)
+        self.assertEqual(1, len(self.saved_checkpoint().active_sessions()))
+
+    def test_backfill_burst(self):
+        self.save_state(cursor=100)
+        tweets = [make_tweet(200 - i, START - timedelta(seconds=10 * i)) for i in range(40)]  # newest first
+        twitter = FakeTwitter(tweets)
+        monitor = self.make_monitor(twitter)
+        monitor.checkpoint.load()
+        monitor._check_tweets(max_age=monitor.intervals[-1])
+        self.assertEqual(40, len(DeferredThread.started))
+        self.assertEqual(200, self.checkpoint_cursor(monitor))
+        self.assertEqual(40, len(self.saved_checkpoint().active_sessions()))
+
+    def test_tweet_ahead_of_clock(self):
+        tweets = [make_tweet(2, START + timedelta(seconds=1)), make_tweet(1, START - timedelta(seconds=3))]
+        monitor = self.make_monitor(FakeTwitter(tweets))
+        monitor._check_tweets(max_age=15)
+        self.assertEqual(2, len(DeferredThread.started))
+        self.assertEqual(2, self.checkpoint_cursor(monitor))
+
+    def test_cursor_stops_before_future_tweet(self):
+        tweets = [make_tweet(3, START + timedelta(seconds=60)), make_tweet(2, START - timedelta(seconds=3)),
+                  make_tweet(1, START - timedelta(seconds=100))]
+        twitter = FakeTwitter(tweets)
+        monitor = self.make_monitor(twitter)
+        monitor._check_tweets(max_age=15)
+        self.assertEqual(1, len(DeferredThread.started))
+        self.assertEqual(2, self.checkpoint_cursor(monitor))  # old tweet 1 was evaluated and skipped
+
+        self.clock.now += timedelta(seconds=61)
+        monitor._check_tweets(max_age=15)
+        self.assertEqual(2, twitter.calls[-1])
+        self.assertEqual(2, len(DeferredThread.started))
+        self.assertEqual(3, self.checkpoint_cursor(monitor))
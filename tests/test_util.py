@@ -1,5 +1,5 @@
 from unittest import TestCase
-from common.util import load_tweet, dt_time_diff, twitter_ts, last_trade_before_dt, binance_ts, splice_trades, OutOfRangeError
+from common.util import load_tweet, dt_time_diff, twitter_ts, twitter_epoch, twitter_dt, ReplayClock, last_trade_before_dt, binance_ts, splice_trades, OutOfRangeError
 from datetime import datetime, timezone
 
 
@@ -12,6 +12,20 @@ class TestTwitterTS(TestCase):
         # Sun Mar 25 16:40:59 +0000 2018
         self.assertEqual(twitter_ts(self.tweet['created_at']).time(), datetime(2018, 3, 25, 16, 40, 59).time())
 
+    def test_epoch(self):
+        self.assertEqual(datetime(2018, 3, 25, 16, 40, 59, tzinfo=timezone.utc).timestamp(),
+                         twitter_epoch(self.tweet['created_at']))
+
+    def test_dt(self):
+        self.assertEqual(datetime(2018, 3, 25, 16, 40, 59), twitter_dt(self.tweet['created_at']))
+
+
+class TestReplayClock(TestCase):
+
+    def test_starts_at_replay_time(self):
+        clock = ReplayClock(datetime(2018, 3, 25))
+        self.assertAlmostEqual(0, dt_time_diff(datetime(2018, 3, 25), clock()), places=2)
+
 
 class TestDTTimeDiff(TestCase):
 